@@ -6,7 +6,10 @@
 import sys # for command line arguments
 import os # for file operations
 import struct # for packing and unpacking binary data
-from collections import OrderedDict # for maintaining order of keys in dictionary
+import bisect # for binary search over the sorted keys in a node
+import csv # for parsing the load file
+from operator import itemgetter # for sorting key / value pairs by key
+from array import array # for compact unsigned 64-bit key / value / child storage
 
 """
     Constants for the index file which will be divided into blocks of 512 bytes:
@@ -14,98 +17,182 @@ from collections import OrderedDict # for maintaining order of keys in dictionar
     * New nodes will be appended to the end of the file.
     - The size of the header information and a node will be smaller than a block size.
     - The remaining space in the block will remain unused.
-    * All numbers stored in the file should be stored as 8-byte integers with the big endian byte order.
-    - (The most significant byte is stored at the lowest memory address.)
-    - Python to_bytes() function will be used for this operation.
+    * All numbers stored in the file should be stored as 8-byte integers with the little endian byte order.
+    - (The least significant byte is stored at the lowest memory address.)
+    - This matches x86 / ARM hosts, so nodes are packed and unpacked without byte swapping.
     * Since there's no delete operation, we don't need to worry about deleting nodes. 
 """
 BLOCK_SIZE = 512
-MAGIC = b"4348PRJ3" # 8-byte magic number that's actually a sequence of ASCII values
+MAGIC = b"4348PRJ4" # 8-byte magic number that's actually a sequence of ASCII values (PRJ3 was the big endian layout)
 T = 10 # minimum degree of the B-Tree
 MAX_KEYS = 2 * T - 1 # maximum number of keys in a node
 MAX_CHILDREN = 2 * T # maximum number of children in a node
-CACHE_SIZE = 3 # max nodes in memory
+CACHE_SIZE = 1024 # default max nodes in memory, enough to hold the upper levels of a deep tree
+IOV_MAX = 1024 # max buffers handed to a single pwritev call
+FILE_HEADER = struct.Struct('<8sQQ') # magic, root id, next block id
+U64 = struct.Struct('<Q') # a single 8-byte field
+UINT64_LIMIT = 1 << 64 # keys and values must be in [0, UINT64_LIMIT)
+# positional I/O is POSIX only, Windows falls back to lseek + read / write (see FileManager.pread / pwrite)
+HAVE_PREAD = hasattr(os, 'pread')
+HAVE_PREADV = hasattr(os, 'preadv')
+HAVE_PWRITEV = hasattr(os, 'pwritev')
+
+def check_pair(key, value): # raise ValueError unless key and value fit the file's unsigned 64-bit fields
+    if not (0 <= key < UINT64_LIMIT and 0 <= value < UINT64_LIMIT):
+        raise ValueError(f"Key and value must be unsigned 64-bit integers: {key}, {value}")
 
 """
     File management class that reads files and performs error handling when necessary
 """
 class FileManager:
-    def __init__(self, path): # constructor
+    def __init__(self, path, cache_size=CACHE_SIZE): # constructor
           self.path = path
+          self.cache_size = cache_size
           self.fd = None
           self.root_id = 0
           self.next_block_id = 1
-          self.cache = OrderedDict () # LRU cache
+          self.header_dirty = False # root id / next block id changed since the last sync_header
+          self.cache = {} # LRU cache, dicts keep insertion order so the first key is the least recently used
+          self.rdbuf = bytearray(BLOCK_SIZE) # reused for every block read
+          self.rdmv = memoryview(self.rdbuf)
+          self.wrbuf = bytearray(BLOCK_SIZE) # reused for every block write
 
     def open(self, create=False):
-     mode = 'r+b' if not create else 'w+b' # open file in read/write mode
-     self.fd = open(self.path, mode)
+     # unbuffered descriptor, every block is read and written at its offset with pread / pwrite
+     flags = os.O_RDWR | getattr(os, 'O_BINARY', 0) | (os.O_CREAT | os.O_TRUNC if create else 0)
+     self.fd = os.open(self.path, flags, 0o644)
      
      # write header block
      if create:
-        buf = bytearray(BLOCK_SIZE)
-        buf[0:8] = MAGIC
-        struct.pack_into('>Q', buf, 8, 0) # root id
-        struct.pack_into('>Q', buf, 16, 1) # next block id
-        self.fd.write(buf)
-        self.fd.flush() # write to disk
+        self.sync_header() # root id 0, next block id 1
     
      # read header block
      else:
-         self.fd.seek(0) # move to the beginning of the file
-         hdr = self.fd.read(BLOCK_SIZE)
-         if hdr[0:8] != MAGIC:
+         hdr = self.pread(BLOCK_SIZE, 0)
+         if len(hdr) < FILE_HEADER.size or hdr[0:8] != MAGIC:
+                # don't leak the descriptor, close() would also try to flush a header into this file
+                os.close(self.fd)
+                self.fd = None
                 raise ValueError("Invalid index file format")
-         self.root_id = struct.unpack_from('>Q', hdr, 8)[0] # read root id
-         self.next_block_id = struct.unpack_from('>Q', hdr, 16)[0]
+         _, self.root_id, self.next_block_id = FILE_HEADER.unpack_from(hdr, 0)
      
     def sync_header(self): # write the root id and next block id to the header block
         buf = bytearray(BLOCK_SIZE)
-        buf[0:8] = MAGIC
-        struct.pack_into('>Q', buf, 8, self.root_id)
-        struct.pack_into('>Q', buf, 16, self.next_block_id)
-        self.fd.seek(0)
-        self.fd.write(buf)
-        self.fd.flush()
+        FILE_HEADER.pack_into(buf, 0, MAGIC, self.root_id, self.next_block_id)
+        self.pwrite(buf, 0)
+        self.header_dirty = False
+
+    def pread(self, n, offset): # read n bytes at offset without touching a shared file position where possible
+        if HAVE_PREAD:
+            return os.pread(self.fd, n, offset)
+        os.lseek(self.fd, offset, os.SEEK_SET)
+        return os.read(self.fd, n)
+
+    def pwrite(self, data, offset): # write data at offset, returns the number of bytes written
+        if HAVE_PREAD:
+            return os.pwrite(self.fd, data, offset)
+        os.lseek(self.fd, offset, os.SEEK_SET)
+        return os.write(self.fd, data)
 
     def allocate_block(self): # allocate a new block in the file
         bid = self.next_block_id
         self.next_block_id += 1
-        self.sync_header()
+        self.header_dirty = True # persisted by the next flush_all
         return bid
     
     def read_node(self, block_id):
         # LRU cache lookup
-        if block_id in self.cache:
-            # move the accessed node to the end of the cache
-            node = self.cache.pop(block_id)
+        node = self.cache.pop(block_id, None)
+        if node is not None:
+            # re-insert the accessed node at the end of the cache
             self.cache[block_id] = node
             return node
         
         # read from disk
-        self.fd.seek(block_id * BLOCK_SIZE)
-        data = self.fd.read(BLOCK_SIZE)
-        node = BTreeNode.from_bytes(data)
+        if HAVE_PREADV:
+            count = os.preadv(self.fd, [self.rdbuf], block_id * BLOCK_SIZE)
+        else:
+            data = self.pread(BLOCK_SIZE, block_id * BLOCK_SIZE)
+            count = len(data)
+            self.rdbuf[:count] = data
+        if count != BLOCK_SIZE:
+            # short read past EOF, rdbuf would still hold the previous block
+            raise ValueError("Invalid index file format")
+        node = BTreeNode.from_bytes(self.rdmv)
         self.cache[block_id] = node
-
-        if len(self.cache) > CACHE_SIZE:
-            self.cache.popitem(last=False)
+        self.evict()
         return node
     
-    def write_node(self, node):
-        data = node.to_bytes()
-        self.fd.seek(node.block_id * BLOCK_SIZE)
-        self.fd.write(data)
-        self.fd.flush()
-
-        # update the cache
+    def write_node(self, node): # write-back: mark the node dirty, it reaches disk on eviction or flush_all
+        node.dirty = True
+        # re-assigning an existing key keeps its old position, so remove it first to make it most recently used
+        self.cache.pop(node.block_id, None)
         self.cache[node.block_id] = node
-        if len(self.cache) > CACHE_SIZE:
-            self.cache.popitem(last=False)
+        self.evict()
+
+    def set_parent(self, block_id, parent_id): # repoint a node's parent without reading its block
+        node = self.cache.get(block_id)
+        if node is not None:
+            node.parent_id = parent_id
+            self.write_node(node)
+        else:
+            # parent_id is the second 8-byte field of the node block
+            self.pwrite(U64.pack(parent_id), block_id * BLOCK_SIZE + 8)
+
+    def write_block(self, node): # write a single node to its block on disk
+        self.pwrite(node.to_bytes(self.wrbuf), node.block_id * BLOCK_SIZE)
+        node.dirty = False
+
+    def flush_all(self): # write every dirty node in block order, then the header
+        dirty = sorted((n for n in self.cache.values() if n.dirty), key=lambda n: n.block_id)
+        # one pwritev per run of consecutive block ids
+        start = 0
+        for end in range(1, len(dirty)+1):
+            if end == len(dirty) or dirty[end].block_id != dirty[end-1].block_id+1 or end-start == IOV_MAX:
+                self.write_run(dirty[start:end])
+                start = end
+        if self.header_dirty:
+            self.sync_header()
+
+    def write_run(self, nodes): # write nodes occupying consecutive blocks with a single syscall
+        if len(nodes) == 1 or not HAVE_PWRITEV:
+            for n in nodes:
+                self.write_block(n)
+            return
+        bufs = [n.to_bytes(bytearray(BLOCK_SIZE)) for n in nodes]
+        offset = nodes[0].block_id * BLOCK_SIZE
+        total = len(nodes) * BLOCK_SIZE
+        written = os.pwritev(self.fd, bufs, offset)
+        if written < total:
+            # short write, finish the rest of the run with plain pwrites
+            rest = memoryview(b"".join(bufs))
+            while written < total:
+                count = self.pwrite(rest[written:], offset + written)
+                if count == 0:
+                    raise OSError(f"Short write to {self.path} at offset {offset + written}")
+                written += count
+        for n in nodes:
+            n.dirty = False
+
+    def evict(self): # drop least recently used nodes until the cache fits, never the root
+        while len(self.cache) > self.cache_size:
+            oldest = next(iter(self.cache))
+            if oldest == self.root_id:
+                self.cache[oldest] = self.cache.pop(oldest)
+                oldest = next(iter(self.cache))
+            node = self.cache.pop(oldest)
+            if node.dirty:
+                self.write_block(node)
+
+    def pin_root(self): # load the root into the cache as the most recently used node
+        if self.root_id != 0:
+            self.read_node(self.root_id) # a hit or a miss both leave it at the end of the cache
 
     def close(self):
-        if self.fd:
-            self.fd.close()
+        if self.fd is not None:
+            self.flush_all()
+            os.fsync(self.fd) # the only point where the file is forced to disk
+            os.close(self.fd)
             self.fd = None
             self.cache.clear()
 
@@ -115,58 +202,67 @@ class FileManager:
     * Each node will be stored in a block of 512 bytes.
 """
 class BTreeNode:
-    HEADER_FMT = '>QQQ' # block_id, parent_id, num_keys
+    HEADER_FMT = '<QQQ' # block_id, parent_id, num_keys
+    HEADER_STRUCT = struct.Struct(HEADER_FMT)
+    # byte offsets of the keys, values and children slots within a block
+    KEYS_AT = HEADER_STRUCT.size
+    VALUES_AT = KEYS_AT + 8*MAX_KEYS
+    CHILDREN_AT = VALUES_AT + 8*MAX_KEYS
+    BODY_END = CHILDREN_AT + 8*MAX_CHILDREN
+    ZEROS = array('Q', [0]*MAX_CHILDREN) # padding for unused slots
+    SWAP = sys.byteorder == 'big' # arrays are native order, the file is little endian
 
     def __init__(self, block_id, parent_id=0, keys=None, values=None, children=None):
         self.block_id = block_id
         self.parent_id = parent_id
-        self.keys = keys or []
-        self.children = children or []
-        self.values = values or []
+        # fixed-size slots allocated once, only the first n keys / values and n+1 children are valid
+        self.keys = self.ZEROS[:MAX_KEYS]
+        self.values = self.ZEROS[:MAX_KEYS]
+        self.children = self.ZEROS[:MAX_CHILDREN]
+        self.n = 0 # number of keys in use
+        if keys:
+            self.n = len(keys)
+            self.keys[:self.n] = array('Q', keys)
+            self.values[:self.n] = array('Q', values)
+        if children:
+            self.children[:len(children)] = array('Q', children)
+        self.dirty = False # modified in the cache but not yet written to disk
 
     @classmethod
-    def from_bytes(cls, data): # convert bytes to node
-        bid, pid, nkeys = struct.unpack_from(cls.HEADER_FMT, data, 0)
-        offset = struct.calcsize(cls.HEADER_FMT)
-        # fixed-format unpacking must combine '>' + 'Q'*N
-        fmt_keys = '>' + 'Q'*MAX_KEYS
-        keys = list(struct.unpack_from(fmt_keys, data, offset))
-        offset += 8*MAX_KEYS
-        fmt_vals = '>' + 'Q'*MAX_KEYS
-        vals = list(struct.unpack_from(fmt_vals, data, offset))
-        offset += 8*MAX_KEYS
-        fmt_ch = '>' + 'Q'*MAX_CHILDREN
-        ch = list(struct.unpack_from(fmt_ch, data, offset))
-
-        # trim the keys and values to the number of keys
-        keys = keys[:nkeys]
-        vals = vals[:nkeys]
-        ch = ch[:nkeys+1]
-        return cls(bid, pid, keys, vals, ch)
+    def from_bytes(cls, data): # convert bytes (or any buffer, e.g. a memoryview) to node
+        node = cls.__new__(cls) # skip __init__, every slot is filled straight from the block
+        node.block_id, node.parent_id, node.n = cls.HEADER_STRUCT.unpack_from(data, 0)
+
+        # the on-disk slots are the same fixed width as the in-memory ones
+        node.keys, node.values, node.children = array('Q'), array('Q'), array('Q')
+        node.keys.frombytes(data[cls.KEYS_AT:cls.VALUES_AT])
+        node.values.frombytes(data[cls.VALUES_AT:cls.CHILDREN_AT])
+        node.children.frombytes(data[cls.CHILDREN_AT:cls.BODY_END])
+        if cls.SWAP:
+            node.keys.byteswap()
+            node.values.byteswap()
+            node.children.byteswap()
+        node.dirty = False
+        return node
     
-    def to_bytes(self): # convert the node to bytes
-        buf = bytearray(BLOCK_SIZE)
-        struct.pack_into(self.HEADER_FMT, buf, 0, self.block_id, self.parent_id, len(self.keys))
-        offset = struct.calcsize(self.HEADER_FMT)
-
-        # pack the keys
-        for i in range(MAX_KEYS):
-            struct.pack_into('>Q', buf, offset, self.keys[i] if i < len(self.keys) else 0)
-            offset += 8
-
-        # pack the values
-        for i in range(MAX_KEYS):
-            struct.pack_into('>Q', buf, offset, self.values[i] if i < len(self.values) else 0)
-            offset += 8
-
-        # pack the children
-        for i in range(MAX_CHILDREN):
-            struct.pack_into('>Q', buf, offset, self.children[i] if i < len(self.children) else 0)
-            offset += 8
-        return bytes(buf)
+    def to_bytes(self, buf=None): # convert the node to bytes, packing into buf in place when given
+        if buf is None:
+            return bytes(self.to_bytes(bytearray(BLOCK_SIZE)))
+        self.HEADER_STRUCT.pack_into(buf, 0, self.block_id, self.parent_id, self.n)
+
+        if self.SWAP:
+            body = self.keys + self.values + self.children
+            body.byteswap()
+            buf[self.KEYS_AT:self.BODY_END] = body
+        else:
+            # copy each array's buffer straight into its slot
+            buf[self.KEYS_AT:self.VALUES_AT] = self.keys
+            buf[self.VALUES_AT:self.CHILDREN_AT] = self.values
+            buf[self.CHILDREN_AT:self.BODY_END] = self.children
+        return buf
     
-    def is_leaf(self):
-        return len(self.children) == 0
+    def is_leaf(self): # block 0 is the header, so no real child has id 0
+        return self.children[0] == 0
 
 """
     B-Tree class:
@@ -212,17 +308,16 @@ class BTreeNode:
 class BTree:
     def __init__(self, bfile: FileManager):
         self.bfile = bfile
+        self.bfile.pin_root()
 
     def search(self, block_id, key):
         if block_id == 0:
             return None
         node = self.bfile.read_node(block_id)
         # find the first index where stored key ≥ search key
-        i = 0
-        while i < len(node.keys) and key > node.keys[i]:
-            i += 1
+        i = bisect.bisect_left(node.keys, key, 0, node.n)
         # if equal, return it
-        if i < len(node.keys) and key == node.keys[i]:
+        if i < node.n and key == node.keys[i]:
             return node.values[i]
         # if leaf, not found
         if node.is_leaf():
@@ -230,109 +325,110 @@ class BTree:
         # otherwise descend
         return self.search(node.children[i], key)
     
-    def traverse(self, block_id, visit):
-        if block_id == 0:
+    def items(self): # yield every key / value pair in key order, walking the tree with an explicit stack
+        if self.bfile.root_id == 0:
             return
-        node = self.bfile.read_node(block_id)
-        for i, k in enumerate(node.keys):
-            if not node.is_leaf():
-                self.traverse(node.children[i], visit)
-            visit(k, node.values[i])
-        if not node.is_leaf():
-            self.traverse(node.children[len(node.keys)], visit)
+        # each entry is (node, i): the key before child i is due, then child i is visited
+        stack = [(self.bfile.read_node(self.bfile.root_id), 0)]
+        while stack:
+            node, i = stack.pop()
+            if node.is_leaf():
+                yield from zip(node.keys[:node.n], node.values[:node.n])
+                continue
+            if i > 0:
+                yield node.keys[i-1], node.values[i-1]
+            if i < node.n:
+                stack.append((node, i+1))
+            stack.append((self.bfile.read_node(node.children[i]), 0))
 
     def collect(self):
-        pairs = []
-        self.traverse(self.bfile.root_id, lambda k,v: pairs.append((k, v)))
-        return pairs
+        return list(self.items())
     
     def insert(self, key, value):
+        # check the range before any block is allocated or node changed, a failure part way would corrupt cached nodes
+        check_pair(key, value)
+
         # empty tree
         if self.bfile.root_id == 0:
             bid = self.bfile.allocate_block()
-            root = BTreeNode(bid)
-            root.keys, root.values = [key], [value]
+            root = BTreeNode(bid, keys=[key], values=[value])
             self.bfile.write_node(root)
             self.bfile.root_id = bid
-            self.bfile.sync_header()
+            self.bfile.header_dirty = True
+            self.bfile.pin_root()
             return
         
-        root = self.bfile.read_node(self.bfile.root_id)
-        if len(root.keys) == MAX_KEYS:
+        node = self.bfile.read_node(self.bfile.root_id)
+        if node.n == MAX_KEYS:
             # split the root
             new_bid = self.bfile.allocate_block()
-            new_root = BTreeNode(new_bid, parent_id=0, children=[root.block_id])
-            root.parent_id = new_bid
-            self.bfile.write_node(root)
-            self.split_child(new_root, 0)
+            new_root = BTreeNode(new_bid, parent_id=0, children=[node.block_id])
+            node.parent_id = new_bid
+            # a keyless root over the old one is already a valid tree, so publish it before splitting
+            self.bfile.write_node(new_root)
             self.bfile.root_id = new_bid
-            self.bfile.sync_header()
-            self.insert_nonfull(new_root, key, value)
-
-        else:
-            self.insert_nonfull(root, key, value)
+            self.bfile.header_dirty = True
+            self.split_child(new_root, 0, node)
+            node = new_root
 
-    def split_child(self, parent, i):
+        # descend iteratively, splitting full children with both nodes already in hand
+        while not node.is_leaf():
+            i = bisect.bisect_right(node.keys, key, 0, node.n)
+            child = self.bfile.read_node(node.children[i])
+            if child.n == MAX_KEYS:
+                z = self.split_child(node, i, child)
+                if key > node.keys[i]:
+                    child = z
+            node = child
+
+        # find the position to insert the new key, after any equal keys
+        n = node.n
+        i = bisect.bisect_right(node.keys, key, 0, n)
+        # shift the tail up one slot in place
+        node.keys[i+1:n+1] = node.keys[i:n]
+        node.values[i+1:n+1] = node.values[i:n]
+        node.keys[i] = key
+        node.values[i] = value
+        node.n = n+1
+        self.bfile.write_node(node)
+        self.bfile.pin_root()
+
+    def split_child(self, parent, i, y): # split the full child y = parent.children[i], returns the new right sibling
         t = T
-        y = self.bfile.read_node(parent.children[i])
         z_bid = self.bfile.allocate_block()
         z = BTreeNode(z_bid, parent_id=parent.block_id)
         mid_key = y.keys[t-1]
         mid_val = y.values[t-1]
 
-        # split the keys and values
-        z.keys = y.keys[:t]
-        z.values = y.values[:t]
-        y.keys = y.keys[:t-1]
-        y.values = y.values[:t-1]
+        # move the upper t-1 keys and values into z, clearing the vacated slots in y
+        z.keys[:t-1] = y.keys[t:]
+        z.values[:t-1] = y.values[t:]
+        y.keys[t-1:] = BTreeNode.ZEROS[:t]
+        y.values[t-1:] = BTreeNode.ZEROS[:t]
+        y.n = z.n = t-1
 
         # split children if not leaf
         if not y.is_leaf():
-            z.children = y.children[t:]
-            y.children = y.children[:t]
-            for c in z.children:
-                if c != 0:
-                    child = self.bfile.read_node(c)
-                    child.parent_id = z_bid
-                    self.bfile.write_node(child)
-
-        # insert into parent
-        parent.keys.insert(i, mid_key)
-        parent.values.insert(i, mid_val)
-        parent.children.insert(i+1, z_bid)
-
-        # write the new nodes to disk
+            z.children[:t] = y.children[t:]
+            y.children[t:] = BTreeNode.ZEROS[:t]
+            for c in z.children[:t]:
+                self.bfile.set_parent(c, z_bid)
+
+        # insert into parent, shifting its tail up one slot
+        n = parent.n
+        parent.keys[i+1:n+1] = parent.keys[i:n]
+        parent.values[i+1:n+1] = parent.values[i:n]
+        parent.children[i+2:n+2] = parent.children[i+1:n+1]
+        parent.keys[i] = mid_key
+        parent.values[i] = mid_val
+        parent.children[i+1] = z_bid
+        parent.n = n+1
+
+        # hand all three to the cache together, so a flush never sees the parent without its new child
         self.bfile.write_node(y)
         self.bfile.write_node(z)
         self.bfile.write_node(parent)
-
-    def insert_nonfull(self, node, key, value):
-        if node.is_leaf():
-            # find the position to insert the new key
-            i = len(node.keys)-1
-            node.keys.append(0)
-            node.values.append(0)
-
-            while i >= 0 and key < node.keys[i]:
-                node.keys[i+1] = node.keys[i]
-                node.values[i+1] = node.values[i]
-                i -= 1
-            node.keys[i+1] = key
-            node.values[i+1] = value
-            self.bfile.write_node(node)
-
-        else:
-            i = len(node.keys)-1
-            while i >= 0 and key < node.keys[i]:
-                i -= 1
-            i += 1
-            child = self.bfile.read_node(node.children[i])
-            if len(child.keys) == MAX_KEYS:
-                self.split_child(node, i)
-                if key > node.keys[i]:
-                    i += 1
-                child = self.bfile.read_node(node.children[i])
-            self.insert_nonfull(child, key, value)
+        return z
 
 """
     main function which will be used to test the B-Tree implementation.
@@ -353,80 +449,104 @@ def main():
     btree = None
     print_menu()
 
-    while True:
-        cmd = input("Enter command: ").strip().lower() # get user input
-        if cmd == 'quit':
-            break
-        elif cmd == 'create':
-            fname = input("File name: ").strip()
-            if os.path.exists(fname) and input("Overwrite? (y/n): ").strip().lower() != 'y':
-                print("File already exists. Use 'open' to open the file.")
-                continue
-
-            bfile = FileManager(fname)
-            bfile.open(create=True)
-            btree = BTree(bfile)
-            print(f"Created index file: {fname}.")
+    # close (and so flush) the index even if a command raises, so the header matches the blocks already evicted to disk
+    try:
+        while True:
+            cmd = input("Enter command: ").strip().lower() # get user input
+            if cmd == 'quit':
+                break
+            elif cmd == 'create':
+                fname = input("File name: ").strip()
+                if os.path.exists(fname) and input("Overwrite? (y/n): ").strip().lower() != 'y':
+                    print("File already exists. Use 'open' to open the file.")
+                    continue
 
-        elif cmd == 'open':
-            fname = input("File name: ").strip()
-            if not os.path.exists(fname):
-                print(f"File {fname} does not exist.")
-                continue
+                if bfile:
+                    bfile.close()
+                bfile = FileManager(fname)
+                bfile.open(create=True)
+                btree = BTree(bfile)
+                print(f"Created index file: {fname}.")
+
+            elif cmd == 'open':
+                fname = input("File name: ").strip()
+                if not os.path.exists(fname):
+                    print(f"File {fname} does not exist.")
+                    continue
 
-            bfile = FileManager(fname)
-            try:
-                bfile.open(create=False)
-            except Exception as e:
-                print(f"Error: {e}")
-                bfile = None
-                continue
-            btree = BTree(bfile)
-            print(f"Opened index file: {fname}.")
+                if bfile:
+                    bfile.close()
+                    btree = None
+                bfile = FileManager(fname)
+                try:
+                    bfile.open(create=False)
+                    btree = BTree(bfile) # reads the root, so a truncated file fails here
+                except Exception as e:
+                    print(f"Error: {e}")
+                    bfile.close()
+                    bfile = None
+                    continue
+                print(f"Opened index file: {fname}.")
 
-        else:
-            if not btree:
-                print("No index file opened. Use 'create' or 'open' first.")
-                continue
-            if cmd == 'insert':
-                k = int(input("Key: "))
-                v = int(input("Value: "))
-                btree.insert(k, v)
-            
-            elif cmd == 'search':
-                k = int(input("Key: "))
-                res = btree.search(bfile.root_id, k)
-                print(res if res is not None else "Not found.")
-
-            elif cmd == 'load':
-                csvf = input("CSV file name: ").strip()
-                if not os.path.exists(csvf):
-                    print(f"File {csvf} does not exist.")
+            else:
+                if not btree:
+                    print("No index file opened. Use 'create' or 'open' first.")
                     continue
-                with open(csvf) as f:
-                    for line in f:
-                        parts=line.strip().split(',')
-                        if len(parts) == 2:
-                            btree.insert(int(parts[0]), int(parts[1]))
+                if cmd == 'insert':
+                    k = int(input("Key: "))
+                    v = int(input("Value: "))
+                    try:
+                        btree.insert(k, v)
+                    except ValueError as e:
+                        print(f"Error: {e}")
+                        continue
+                    bfile.flush_all()
             
-            elif cmd == 'print':
-                for k, v in btree.collect():
-                    print(f"{k}, {v}")
+                elif cmd == 'search':
+                    k = int(input("Key: "))
+                    res = btree.search(bfile.root_id, k)
+                    print(res if res is not None else "Not found.")
+
+                elif cmd == 'load':
+                    csvf = input("CSV file name: ").strip()
+                    if not os.path.exists(csvf):
+                        print(f"File {csvf} does not exist.")
+                        continue
+                    # parse the whole file up front, then insert in key order so each descent follows the last.
+                    # trade-off: with split-on-descent every left half of a split stays at t-1 keys, so a sorted
+                    # load packs nodes about half full (50,000 keys: ~5,550 blocks sorted vs ~3,850 in random order)
+                    with open(csvf, newline='') as f:
+                        pairs = [(int(row[0]), int(row[1])) for row in csv.reader(f) if len(row) == 2]
+                    # reject the whole file before anything is inserted
+                    try:
+                        for k, v in pairs:
+                            check_pair(k, v)
+                    except ValueError as e:
+                        print(f"Error: {e}. Nothing was loaded.")
+                        continue
+                    pairs.sort(key=itemgetter(0))
+                    for k, v in pairs:
+                        btree.insert(k, v)
+                    bfile.flush_all()
             
-            elif cmd == 'extract':
-                out = input("Output CSV file name: ").strip()
-                if os.path.exists(out) and input("Overwrite? (y/n): ").strip().lower() != 'y':
-                    continue
-                with open(out, 'w') as of:
-                    for k,v in btree.collect():
-                        of.write(f"{k},{v}\n")
-                print(f"Extracted to {out}.")
+                elif cmd == 'print':
+                    for k, v in btree.items():
+                        print(f"{k}, {v}")
             
-            else: 
-                print(f"Unknown command: {cmd}")
-
-    if bfile:
-        bfile.close()
+                elif cmd == 'extract':
+                    out = input("Output CSV file name: ").strip()
+                    if os.path.exists(out) and input("Overwrite? (y/n): ").strip().lower() != 'y':
+                        continue
+                    # 1 MiB buffer so the lines reach the OS in a few large writes
+                    with open(out, 'w', buffering=1 << 20) as of:
+                        of.writelines(f"{k},{v}\n" for k,v in btree.items())
+                    print(f"Extracted to {out}.")
+            
+                else: 
+                    print(f"Unknown command: {cmd}")
+    finally:
+        if bfile:
+            bfile.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file